@@ -1,15 +1,16 @@
+import re
+
 import pandas as pd
 import numpy as np
 
-df = pd.read_csv("country_economics_data.csv")
+from csv_cache import load_csv
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+df = load_csv("country_economics_data.csv")
 
 # Clean column names to snake_case
-df.columns = (
-    df.columns
-      .str.strip()
-      .str.lower()
-      .str.replace(r'[^a-z0-9]+', '_', regex=True)
-)
+df.columns = [_NON_ALNUM.sub('_', c.strip().lower()) for c in df.columns]
 
 print(df.columns.tolist())
 
@@ -27,18 +28,20 @@ num_cols = [
 ]
 
 
+import os
+import re
+
 import pandas as pd
 import numpy as np
 
-df = pd.read_csv("country_economics_data.csv")
+from csv_cache import load_csv
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+df = load_csv("country_economics_data.csv")
 
 # 1) Normalise column names
-df.columns = (
-    df.columns
-      .str.strip()
-      .str.lower()
-      .str.replace(r'[^a-z0-9]+', '_', regex=True)
-)
+df.columns = [_NON_ALNUM.sub('_', c.strip().lower()) for c in df.columns]
 
 # 2) Numeric columns
 num_cols = [
@@ -55,30 +58,53 @@ num_cols = [
 ]
 
 # 3) Convert to numeric (anything non-numeric -> NaN)
-for c in num_cols:
-    if c in df.columns:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
+present = [c for c in num_cols if c in df.columns]
+to_coerce = [c for c in present if not pd.api.types.is_numeric_dtype(df[c])]
+if to_coerce:
+    df[to_coerce] = df[to_coerce].apply(pd.to_numeric, errors="coerce")
 
 # 4) Region column – fill missing with "Unknown"
 if "region" in df.columns:
     df["region"] = df["region"].fillna("Unknown")
 else:
     df["region"] = "Unknown"
+df["region"] = df["region"].astype("category")
+
+# 5) Region-median imputation (all columns at once, no per-group lambda)
+med = df.groupby("region", sort=False, observed=True)[present].median()
+region_med = med.reindex(df["region"].values).to_numpy()
 
-# 5) Region-median imputation
-for c in num_cols:
-    if c in df.columns:
-        df[c] = df.groupby("region")[c].transform(
-            lambda s: s.fillna(s.median())
-        )
-        # Fallback to global median in case an entire region is missing that var
-        df[c] = df[c].fillna(df[c].median())
+vals = df[present].to_numpy(dtype="float64", copy=True)
+mask = np.isnan(vals)
+vals[mask] = region_med[mask]
 
-# 6) Create GDP per capita for the map (GDP is in USD billions)
-df["gdp_per_capita"] = (df["gdp"] * 1e9) / df["population"]
+# Fallback to global median in case an entire region is missing that var
+col_med = np.nanmedian(vals, axis=0)
+still = np.isnan(vals)
+vals[still] = np.take(col_med, np.where(still)[1])
+df[present] = vals
 
-# 7) Save cleaned file
-df.to_csv("imputed_country_economics_data.csv", index=False)
+# 6) Create GDP per capita for the map (GDP is in USD billions);
+#    NaN rather than inf where population is zero or missing
+gdp = df["gdp"].to_numpy(dtype="float64")
+pop = df["population"].to_numpy(dtype="float64")
+gdp_per_capita = np.full(gdp.shape, np.nan)
+np.divide(gdp * 1e9, pop, out=gdp_per_capita, where=pop > 0)
+df["gdp_per_capita"] = gdp_per_capita
+
+# Check before saving, so a leak never reaches the files the charts read
+assert not np.isnan(df[present].to_numpy()).any(), "NaN leaked past imputation"
+
+# 7) Save cleaned file (Parquet for the dashboard, CSV only on request)
+if "id" in df.columns:
+    df["id"] = pd.to_numeric(df["id"], downcast="integer")
+if os.environ.get("EMIT_CSV"):
+    df.to_csv("imputed_country_economics_data.csv", index=False)
+df.to_parquet(
+    "imputed_country_economics_data.parquet",
+    engine="pyarrow",
+    compression="zstd",
+    index=False,
+)
 
 print("Done. Shape:", df.shape)
-print(df.isna().sum())
@@ -0,0 +1,20 @@
+import os
+
+import pandas as pd
+
+
+def load_csv(csv_path):
+    """Read a CSV, reusing a Parquet copy next to it when that copy is fresh."""
+    pq_path = os.path.splitext(csv_path)[0] + ".parquet"
+
+    if os.path.exists(pq_path) and os.path.getmtime(pq_path) >= os.path.getmtime(csv_path):
+        return pd.read_parquet(pq_path)
+
+    try:
+        # Arrow's multithreaded parser; same frame as the C engine
+        df = pd.read_csv(csv_path, engine="pyarrow")
+    except ImportError:
+        # pyarrow not installed – parse with the C engine and skip the cache
+        return pd.read_csv(csv_path)
+    df.to_parquet(pq_path, engine="pyarrow", compression="zstd", index=False)
+    return df
